@@ -4,6 +4,11 @@ Extract CVEs from Kubescape Operator CRDs (VulnerabilityManifestSummary and Vuln
 
 This script queries Kubernetes API to get vulnerability scan results from Kubescape operator
 and extracts CVEs matching the specified severity and namespace filters.
+
+If the optional `ijson` package is installed (pip install ijson), kubectl list output is
+parsed incrementally straight from the pipe instead of being buffered and decoded in one go,
+which keeps memory low on clusters with many large VulnerabilityManifests. If the optional
+`orjson` package is installed, it is used for the remaining JSON decoding.
 """
 
 import json
@@ -12,84 +17,220 @@ import subprocess
 import argparse
 import tempfile
 import os
+from urllib.parse import urlencode
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# VulnerabilityManifests are listed straight from the aggregated storage API,
+# one page at a time, so memory stays bounded by the page size rather than by
+# the number of manifests in the cluster.
+VM_LIST_PATH = '/apis/spdx.softwarecomposition.kubescape.io/v1beta1/namespaces/kubescape/vulnerabilitymanifests'
+VM_PAGE_SIZE = 500
+
+# Severities reported in a VulnerabilityManifestSummary's spec.severities
+SEVERITIES = ('critical', 'high', 'medium', 'low')
+
+# Only the VulnerabilityManifestSummary fields we use, one summary per line:
+# namespace|name|all-ref|relevant-ref|workload-namespace label|
+# critical.all|critical.relevant|high.all|high.relevant|...
+VMS_JSONPATH = (
+    '{range .items[*]}'
+    '{.metadata.namespace}{"|"}'
+    '{.metadata.name}{"|"}'
+    '{.spec.vulnerabilitiesRef.all.name}{"|"}'
+    '{.spec.vulnerabilitiesRef.relevant.name}{"|"}'
+    r'{.metadata.labels.kubescape\.io/workload-namespace}'
+    + ''.join(
+        f'{{"|"}}{{.spec.severities.{severity}.all}}{{"|"}}{{.spec.severities.{severity}.relevant}}'
+        for severity in SEVERITIES
+    )
+    + r'{"\n"}'
+    '{end}'
+)
 
 
 def run_kubectl_command(cmd):
-    """Run kubectl command and return JSON output."""
+    """Run kubectl command (an argv list) and return JSON output."""
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=False
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
         )
-        if result.returncode != 0:
-            return None
-        return json.loads(result.stdout)
-    except (subprocess.CalledProcessError, json.JSONDecodeError, ValueError):
+    except OSError:
         return None
 
+    # Decode straight from the pipe rather than capturing stdout as one big
+    # string first and decoding that.
+    try:
+        if orjson is not None:
+            data = orjson.loads(proc.stdout.read())
+        else:
+            data = json.load(proc.stdout)
+    except ValueError:
+        data = None
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+    if proc.returncode != 0:
+        return None
+    return data
+
+
+def iter_kubectl_items(cmd, list_metadata=None):
+    """
+    Run a kubectl list command and yield its items one at a time.
 
-def get_vulnerability_manifest_summary_names(namespace_filter=None):
-    """Get list of VulnerabilityManifestSummary resource names, optionally filtered by namespace."""
+    If list_metadata is a dict, it is filled with the list's metadata.continue token (if any).
+    """
+    if ijson is None:
+        list_json = run_kubectl_command(cmd)
+        if list_json:
+            if list_metadata is not None:
+                list_metadata['continue'] = list_json.get('metadata', {}).get('continue')
+            yield from list_json.get('items', [])
+        return
+
+    # Parse items straight off kubectl's stdout as they arrive, so the raw
+    # response is never held in memory and parsing overlaps the network read.
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        # kubectl not installed
+        return
+    try:
+        events = ijson.parse(proc.stdout, use_float=True)
+        if list_metadata is not None:
+            events = capture_continue_token(events, list_metadata)
+        yield from ijson.items(events, 'items.item')
+    except ijson.JSONError:
+        # kubectl failed (empty or truncated output)
+        pass
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+def iter_kubectl_lines(cmd):
+    """Run a kubectl command and yield its non-empty output lines."""
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+    except OSError:
+        # kubectl not installed
+        return
+    try:
+        for line in proc.stdout:
+            line = line.rstrip('\n')
+            if line:
+                yield line
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+def capture_continue_token(events, list_metadata):
+    """Pass ijson parse events through, recording metadata.continue on the way."""
+    for prefix, event, value in events:
+        if prefix == 'metadata.continue':
+            list_metadata['continue'] = value
+        yield prefix, event, value
+
+
+def fetch_all_vms(namespace_filter=None):
+    """
+    Get all VulnerabilityManifestSummary resources, optionally filtered by namespace.
+
+    Returns a list of (namespace, vms_name, vm_name, workload_ns, counts) tuples, where vm_name
+    is the referenced VulnerabilityManifest ('all' preferred over 'relevant', empty if neither
+    is set), workload_ns falls back to the summary's own namespace, and counts maps severity to
+    the number of vulnerabilities the summary reports for that manifest. Counts the summary does
+    not report are left out of the dict. With a namespace filter, summaries are ordered by the
+    position of their namespace in it.
+    """
+    # A single cluster-wide list is filtered in-process, rather than running
+    # one kubectl per requested namespace. Only the fields above are printed,
+    # so there is no full JSON object per summary to decode.
+    cmd = ["kubectl", "get", "vulnerabilitymanifestsummary", "-A", "-o", f"jsonpath={VMS_JSONPATH}"]
+
+    # Namespace -> position in the filter. The first summary for a manifest
+    # decides the namespace its CVEs are reported under, so the filter's
+    # order is kept rather than the cluster-wide listing's.
+    ns_order = None
     if namespace_filter:
-        # Query specific namespaces
-        all_names = []
+        ns_order = {}
         for ns in namespace_filter.split(','):
-            cmd = f"kubectl get vulnerabilitymanifestsummary -n {ns} --no-headers -o custom-columns=NAME:.metadata.name"
-            try:
-                result = subprocess.run(
-                    cmd,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    check=False
-                )
-                if result.returncode == 0:
-                    names = [n.strip() for n in result.stdout.strip().split('\n') if n.strip()]
-                    all_names.extend([(ns, name) for name in names])
-            except:
-                pass
-        return all_names
-    else:
-        # Query all namespaces
-        cmd = "kubectl get vulnerabilitymanifestsummary -A --no-headers -o custom-columns=NAMESPACE:.metadata.namespace,NAME:.metadata.name"
-        try:
-            result = subprocess.run(
-                cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                check=False
-            )
-            if result.returncode == 0:
-                names = []
-                for line in result.stdout.strip().split('\n'):
-                    if line.strip():
-                        parts = line.strip().split()
-                        if len(parts) >= 2:
-                            names.append((parts[0], parts[1]))
-                return names
-        except:
-            pass
-        return []
+            ns = ns.strip()
+            if ns:
+                ns_order.setdefault(ns, len(ns_order))
+
+    summaries = []
+    for line in iter_kubectl_lines(cmd):
+        parts = line.split('|')
+        if len(parts) != 5 + 2 * len(SEVERITIES):
+            continue
+        namespace, vms_name, all_ref, relevant_ref, workload_ns_label = parts[:5]
+        if ns_order is not None and namespace not in ns_order:
+            continue
+
+        # Counts for the manifest we are going to read: even columns are the
+        # 'all' counts, odd ones the 'relevant' counts
+        count_values = parts[5::2] if all_ref else parts[6::2]
+        counts = {
+            severity: int(value)
+            for severity, value in zip(SEVERITIES, count_values)
+            if value.isdigit()
+        }
+
+        summaries.append((namespace, vms_name, all_ref or relevant_ref, workload_ns_label or namespace, counts))
+
+    if ns_order is not None:
+        summaries.sort(key=lambda summary: ns_order[summary[0]])
+    return summaries
 
 
-def get_vulnerability_manifest_summary(vms_name, namespace):
-    """Get a single VulnerabilityManifestSummary resource."""
-    cmd = f"kubectl get vulnerabilitymanifestsummary {vms_name} -n {namespace} -o json"
-    return run_kubectl_command(cmd)
+def iter_all_vm():
+    """Yield (name, item) for every VulnerabilityManifest in the kubescape namespace, page by page."""
+    continue_token = None
+    while True:
+        query = {'limit': VM_PAGE_SIZE}
+        if continue_token:
+            query['continue'] = continue_token
+        cmd = ["kubectl", "get", "--raw", f"{VM_LIST_PATH}?{urlencode(query)}"]
 
+        list_metadata = {}
+        for item in iter_kubectl_items(cmd, list_metadata):
+            yield item.get('metadata', {}).get('name'), item
 
-def get_vulnerability_manifest(vm_name):
-    """Get a VulnerabilityManifest resource from the kubescape namespace."""
-    cmd = f"kubectl get vulnerabilitymanifest {vm_name} -n kubescape -o json"
-    return run_kubectl_command(cmd)
+        continue_token = list_metadata.get('continue')
+        if not continue_token:
+            break
 
 
-def extract_cves_from_manifest(vm_json, severity_filter, namespace_val):
-    """Extract CVEs from a VulnerabilityManifest JSON object."""
+def extract_cves_from_manifest(vm_json, severity_filter, namespace_val, seen_cve_ids):
+    """
+    Extract CVEs from a VulnerabilityManifest JSON object.
+
+    Only CVEs not already in seen_cve_ids are returned, and seen_cve_ids is updated with them.
+    """
     if not vm_json:
         return []
 
@@ -98,7 +239,7 @@ def extract_cves_from_manifest(vm_json, severity_filter, namespace_val):
         return []
 
     cve_list = []
-    seen_cves = set()
+    match_all = severity_filter == 'all'
 
     for match in matches:
         vuln = match.get('vulnerability')
@@ -106,14 +247,13 @@ def extract_cves_from_manifest(vm_json, severity_filter, namespace_val):
             continue
 
         # Filter by severity
-        severity = vuln.get('severity', 'unknown').lower()
-        if severity_filter != 'all' and severity_filter not in severity:
+        if not match_all and severity_filter not in vuln.get('severity', 'unknown').lower():
             continue
 
         cve_id = vuln.get('id')
-        if not cve_id or cve_id in seen_cves:
+        if not cve_id or cve_id in seen_cve_ids:
             continue
-        seen_cves.add(cve_id)
+        seen_cve_ids.add(cve_id)
 
         artifact = match.get('artifact', {})
         fix_versions = vuln.get('fix', {}).get('versions', [])
@@ -131,91 +271,93 @@ def extract_cves_from_manifest(vm_json, severity_filter, namespace_val):
     return cve_list
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Extract CVEs from Kubescape Operator CRDs')
-    parser.add_argument('--severity', required=True, help='Severity filter (all, critical, high, medium, low)')
-    parser.add_argument('--namespace', help='Comma-separated list of namespaces to filter')
-    parser.add_argument('--kubeconfig', help='Path to kubeconfig file')
+def iter_cves(vms_items, vm_items, severity_filter, namespace_filter):
+    """
+    Yield unique CVEs from all VulnerabilityManifests referenced by the given summaries.
 
-    args = parser.parse_args()
+    vm_items is an iterable of (name, manifest) pairs; each manifest is extracted as it arrives
+    and then dropped, so only one is held in memory at a time.
+    """
+    # Work out up front which manifests are needed, and the workload namespace
+    # to report for each. Several summaries (e.g. workloads running the same
+    # image) often point at the same manifest; the first one wins, and the
+    # manifest is only extracted once.
+    wanted = {}
 
-    # Set kubeconfig if provided
-    if args.kubeconfig:
-        os.environ['KUBECONFIG'] = args.kubeconfig
+    for namespace, vms_name, vm_name, workload_ns, counts in vms_items:
+        if not vm_name:
+            continue
 
-    severity_filter = args.severity.lower()
-    namespace_filter = args.namespace
+        # Skip manifests the summary says have nothing at the requested
+        # severity. Only the SEVERITIES are counted, so any other filter (e.g.
+        # negligible) always extracts. Zero counts may be omitted from the
+        # summary, so a missing count only means zero when the summary reports
+        # other counts.
+        if severity_filter in SEVERITIES and counts and not counts.get(severity_filter):
+            continue
 
-    # Get list of VulnerabilityManifestSummary resource names
-    vms_names = get_vulnerability_manifest_summary_names(namespace_filter)
+        # Apply namespace filter if specified
+        if namespace_filter:
+            ns_list = [ns.strip() for ns in namespace_filter.split(',')]
+            if workload_ns not in ns_list:
+                continue
 
-    if not vms_names:
-        print("DEBUG: No VMS names found", file=sys.stderr)
-        print(json.dumps([]))
+        wanted.setdefault(vm_name, workload_ns)
+
+    # Nothing to extract: don't list the manifests at all
+    if not wanted:
         return
 
-    all_cves = []
     seen_cve_ids = set()
 
-    # Process each VulnerabilityManifestSummary individually
-    processed = 0
-    skipped_no_vm = 0
-    skipped_ns_filter = 0
-    skipped_no_manifest = 0
-
-    for namespace, vms_name in vms_names:
-        # Get the individual VMS item
-        vms_item = get_vulnerability_manifest_summary(vms_name, namespace)
-        if not vms_item:
+    for vm_name, vm_json in vm_items:
+        workload_ns = wanted.get(vm_name)
+        if workload_ns is None:
             continue
-        # Get the vulnerability manifest name
-        vulnerabilities_ref = vms_item.get('spec', {}).get('vulnerabilitiesRef', {})
-        vm_name = None
 
-        # Try 'all' first, then 'relevant'
-        if vulnerabilities_ref.get('all', {}).get('name'):
-            vm_name = vulnerabilities_ref['all']['name']
-        elif vulnerabilities_ref.get('relevant', {}).get('name'):
-            vm_name = vulnerabilities_ref['relevant']['name']
+        # Extract CVEs from the manifest, skipping any already emitted for an
+        # earlier manifest
+        yield from extract_cves_from_manifest(vm_json, severity_filter, workload_ns, seen_cve_ids)
 
-        if not vm_name:
-            skipped_no_vm += 1
-            continue
 
-        # Get the workload namespace from labels or metadata
-        workload_ns = (
-            vms_item.get('metadata', {}).get('labels', {}).get('kubescape.io/workload-namespace') or
-            vms_item.get('metadata', {}).get('namespace')
-        )
+def write_json_array(items, out=sys.stdout):
+    """Write items as a JSON array one element at a time, so the full result is never buffered."""
+    out.write('[')
+    first = True
+    for item in items:
+        out.write('\n  ' if first else ',\n  ')
+        out.write(json.dumps(item))
+        first = False
+    out.write(']\n' if first else '\n]\n')
 
-        # Apply namespace filter if specified
-        if namespace_filter:
-            ns_list = [ns.strip() for ns in namespace_filter.split(',')]
-            if workload_ns not in ns_list:
-                skipped_ns_filter += 1
-                continue
 
-        # Get the VulnerabilityManifest (always from kubescape namespace)
-        vm_json = get_vulnerability_manifest(vm_name)
-        if not vm_json:
-            skipped_no_manifest += 1
-            continue
+def main():
+    parser = argparse.ArgumentParser(description='Extract CVEs from Kubescape Operator CRDs')
+    parser.add_argument('--severity', required=True, help='Severity filter (all, critical, high, medium, low)')
+    parser.add_argument('--namespace', help='Comma-separated list of namespaces to filter')
+    parser.add_argument('--kubeconfig', help='Path to kubeconfig file')
 
-        # Extract CVEs from the manifest
-        cves = extract_cves_from_manifest(vm_json, severity_filter, workload_ns)
+    args = parser.parse_args()
 
-        if cves:
-            processed += 1
+    # Set kubeconfig if provided
+    if args.kubeconfig:
+        os.environ['KUBECONFIG'] = args.kubeconfig
+
+    severity_filter = args.severity.lower()
+    namespace_filter = args.namespace
+
+    # One list call for the summaries; the manifests they reference are then
+    # streamed page by page and joined in-process, instead of one kubectl call
+    # per VMS/VM.
+    vms_items = fetch_all_vms(namespace_filter)
 
-        # Add unique CVEs to the list
-        for cve in cves:
-            cve_id = cve.get('cve')
-            if cve_id and cve_id not in seen_cve_ids:
-                seen_cve_ids.add(cve_id)
-                all_cves.append(cve)
+    if not vms_items:
+        print("DEBUG: No VMS names found", file=sys.stderr)
+        write_json_array([])
+        return
 
-    # Output as JSON
-    print(json.dumps(all_cves, indent=2))
+    # Output as a JSON array, written one CVE at a time as it is extracted
+    write_json_array(iter_cves(vms_items, iter_all_vm(), severity_filter, namespace_filter))
 
 
 if __name__ == '__main__':
@@ -11,51 +11,67 @@ Requirements:
     - kubectl configured with access to management cluster
     - kubeconfig file at: /Users/deepak.muley/ws/nkp/dm-nkp-mgmt-1.conf
     - Output: docs/internal/CLUSTERAPP-BLOCK-DIAGRAM.md (not tracked in git)
+    - Optional: orjson (pip install orjson) for faster JSON parsing
 """
 
 import sys
 import re
 import os
 import subprocess
-import tempfile
 import json
 from collections import defaultdict, deque
+from functools import lru_cache
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Version suffix of a versioned app name, e.g. "-1.14.5" in "cert-manager-1.14.5"
+_BASE_RE = re.compile(r'-\d+\.\d+\.\d+.*$')
+
+@lru_cache(maxsize=None)
 def get_base_name(app_name):
     """Extract base name from versioned app name."""
-    base = re.sub(r'-\d+\.\d+\.\d+.*$', '', app_name)
+    base = _BASE_RE.sub('', app_name)
     return base
 
-def parse_clusterapps(file_path):
-    """Parse ClusterApps and their dependencies."""
+def parse_clusterapps_from_items(items):
+    """Parse ClusterApps and their dependencies from `kubectl get clusterapps -o json` items."""
     apps = {}
     dependents = defaultdict(set)
 
-    with open(file_path, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-
-            parts = line.split('|')
-            if len(parts) < 2:
-                continue
-
-            app_name = parts[0].strip()
-            deps_str = parts[1].strip() if len(parts) > 1 else ""
-
-            apps[app_name] = []
-
-            if deps_str and deps_str != "N/A":
-                deps = [d.strip() for d in deps_str.split(',') if d.strip()]
-                apps[app_name] = deps
-
-                for dep in deps:
-                    for existing_app in apps.keys():
-                        base_name = get_base_name(existing_app)
-                        if base_name == dep or existing_app == dep:
-                            dependents[existing_app].add(app_name)
-                            break
+    for item in items:
+        metadata = item.get('metadata', {})
+        app_name = metadata.get('name')
+        if not app_name:
+            continue
+
+        annotations = metadata.get('annotations') or {}
+        deps_str = (
+            annotations.get('apps.kommander.d2iq.io/dependencies') or
+            annotations.get('apps.kommander.d2iq.io/required-dependencies') or
+            ""
+        ).strip()
+
+        apps[app_name] = []
+
+        if deps_str and deps_str != "N/A":
+            deps = [d.strip() for d in deps_str.split(',') if d.strip()]
+            apps[app_name] = deps
+
+    # Index apps by exact and base name once, so each dependency resolves
+    # with a dict lookup instead of a scan over all apps. The first app seen
+    # for a base name wins, as before.
+    base_index = {}
+    for existing_app in apps:
+        base_index.setdefault(get_base_name(existing_app), existing_app)
+
+    for app_name, deps in apps.items():
+        for dep in deps:
+            parent = dep if dep in apps else base_index.get(dep)
+            if parent:
+                dependents[parent].add(app_name)
 
     dependents = {k: sorted(v) for k, v in dependents.items()}
     return apps, dependents
@@ -64,26 +80,26 @@ def find_roots(apps):
     """Find root nodes (apps with no dependencies)."""
     return sorted([app for app, deps in apps.items() if not deps])
 
-def create_block_diagram(apps, dependents):
-    """Create a block diagram visualization."""
-    lines = []
-    lines.append("# ClusterApp Dependency Block Diagram")
-    lines.append("")
-    lines.append("This diagram shows each ClusterApp once as a block with its dependencies (parents) and dependents (children).")
-    lines.append("Root nodes (apps with no dependencies) are shown at the top of each chain.")
-    lines.append("")
-    lines.append("## Block Diagram")
-    lines.append("")
-    lines.append("```")
-    lines.append("")
+def render_block_diagram(apps, dependents, out):
+    """Write a block diagram visualization to the file-like object out."""
+    def write(line):
+        out.write(line + "\n")
+
+    write("# ClusterApp Dependency Block Diagram")
+    write("")
+    write("This diagram shows each ClusterApp once as a block with its dependencies (parents) and dependents (children).")
+    write("Root nodes (apps with no dependencies) are shown at the top of each chain.")
+    write("")
+    write("## Block Diagram")
+    write("")
+    write("```")
+    write("")
 
     roots = find_roots(apps)
     processed = set()
 
     def draw_app_block(app_name):
-        """Draw a single app block showing parents and children."""
-        block_lines = []
-
+        """Write a single app block showing parents and children."""
         # Get dependencies (parents)
         deps = apps.get(app_name, [])
         is_root = len(deps) == 0
@@ -94,47 +110,46 @@ def create_block_diagram(apps, dependents):
         # Draw parents (dependencies) above
         if deps:
             deps_list = ", ".join([d[:30] for d in deps])
-            block_lines.append("    ┌─ Parents (depends on): " + deps_list)
-            block_lines.append("    │")
-            block_lines.append("    ▼")
+            write("    ┌─ Parents (depends on): " + deps_list)
+            write("    │")
+            write("    ▼")
 
         # Draw the app block
         app_display = app_name[:60]
         width = max(len(app_display) + 4, 50)
         if is_root:
-            block_lines.append("┌─" + "─" * (width - 4) + "─┐")
-            block_lines.append("│ " + app_display + " [ROOT]" + " " * (width - len(app_display) - 8) + "│")
+            write("┌─" + "─" * (width - 4) + "─┐")
+            write("│ " + app_display + " [ROOT]" + " " * (width - len(app_display) - 8) + "│")
         else:
-            block_lines.append("┌─" + "─" * (width - 4) + "─┐")
-            block_lines.append("│ " + app_display + " " * (width - len(app_display) - 4) + "│")
-        block_lines.append("└─" + "─" * (width - 4) + "─┘")
+            write("┌─" + "─" * (width - 4) + "─┐")
+            write("│ " + app_display + " " * (width - len(app_display) - 4) + "│")
+        write("└─" + "─" * (width - 4) + "─┘")
 
         # Draw children (dependents) below
         if children:
-            block_lines.append("    │")
-            block_lines.append("    ▼")
-            block_lines.append("    └─ Children (used by):")
+            write("    │")
+            write("    ▼")
+            write("    └─ Children (used by):")
             for i, child in enumerate(children):
                 child_display = child[:55]
                 connector = "      ├─" if i < len(children) - 1 else "      └─"
-                block_lines.append(f"{connector} {child_display}")
+                write(f"{connector} {child_display}")
         else:
-            block_lines.append("    └─ (no dependents)")
-
-        return block_lines
+            write("    └─ (no dependents)")
 
     # Draw each root and its chain using BFS
     for root_idx, root in enumerate(roots):
         if root_idx > 0:
-            lines.append("")
-            lines.append("─" * 80)
-            lines.append("")
+            write("")
+            write("─" * 80)
+            write("")
 
-        lines.append(f"### Root Chain {root_idx + 1}: {root}")
-        lines.append("")
+        write(f"### Root Chain {root_idx + 1}: {root}")
+        write("")
 
         # BFS to process all apps in this root's chain
         queue = deque([root])
+        enqueued = {root}  # mirrors queue for O(1) membership checks
         chain_apps = []
 
         while queue:
@@ -148,39 +163,34 @@ def create_block_diagram(apps, dependents):
             # Add children to queue
             children = dependents.get(app, [])
             for child in children:
-                if child not in processed and child not in queue:
+                if child not in processed and child not in enqueued:
                     queue.append(child)
+                    enqueued.add(child)
 
         # Draw all apps in the chain
         for app in chain_apps:
-            block = draw_app_block(app)
-            lines.extend(block)
-            lines.append("")
+            draw_app_block(app)
+            write("")
 
     # Draw remaining apps (orphaned)
     remaining = set(apps.keys()) - processed
     if remaining:
-        lines.append("")
-        lines.append("─" * 80)
-        lines.append("")
-        lines.append("### Orphaned Apps (not connected to any root)")
-        lines.append("")
+        write("")
+        write("─" * 80)
+        write("")
+        write("### Orphaned Apps (not connected to any root)")
+        write("")
         for app in sorted(remaining):
-            block = draw_app_block(app)
-            lines.extend(block)
-            lines.append("")
-
-    lines.append("```")
-    lines.append("")
+            draw_app_block(app)
+            write("")
 
-    return "\n".join(lines)
+    write("```")
 
 def main():
     # Configuration
     kubeconfig = "/Users/deepak.muley/ws/nkp/dm-nkp-mgmt-1.conf"
     output_dir = "docs/internal"
     output_file = os.path.join(output_dir, "CLUSTERAPP-BLOCK-DIAGRAM.md")
-    temp_file = "/tmp/clusterapps-deps.txt"
 
     # Get script directory to find repo root
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -205,40 +215,23 @@ def main():
             check=True
         )
 
-        # Parse JSON and extract dependencies
-        data = json.loads(result.stdout)
-
-        with open(temp_file, 'w') as f:
-            for item in data.get('items', []):
-                app_name = item['metadata']['name']
-                deps = (
-                    item['metadata'].get('annotations', {}).get('apps.kommander.d2iq.io/dependencies') or
-                    item['metadata'].get('annotations', {}).get('apps.kommander.d2iq.io/required-dependencies') or
-                    ""
-                )
-                f.write(f"{app_name}|{deps}\n")
+        data = orjson.loads(result.stdout) if orjson is not None else json.loads(result.stdout)
 
         print(f"Found ClusterApps, parsing dependencies...")
-        apps, dependents = parse_clusterapps(temp_file)
+        apps, dependents = parse_clusterapps_from_items(data.get('items', []))
 
         print(f"Found {len(apps)} ClusterApps")
         print(f"Creating block diagram...")
 
-        diagram = create_block_diagram(apps, dependents)
-
         # Ensure output directory exists
         os.makedirs(output_dir, exist_ok=True)
 
         print(f"Writing to {output_file}...")
         with open(output_file, 'w') as f:
-            f.write(diagram)
+            render_block_diagram(apps, dependents, f)
 
         print(f"Done! Block diagram saved to {output_file}")
 
-        # Cleanup
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
-
     except subprocess.CalledProcessError as e:
         print(f"Error fetching ClusterApps: {e.stderr}", file=sys.stderr)
         sys.exit(1)
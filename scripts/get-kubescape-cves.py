@@ -7,10 +7,12 @@ Usage:
     ./get-kubescape-cves.py critical mgmt
     ./get-kubescape-cves.py high workload1 --namespace default,kube-system
     ./get-kubescape-cves.py all workload2 --namespace kommander
+    ./get-kubescape-cves.py critical --all-clusters
 
 Severity options: all, critical, high, medium, low (default: all)
 Cluster options: mgmt, workload1, workload2 (default: mgmt)
 Namespace filter: --namespace ns1,ns2,... (comma-separated, optional)
+All clusters: --all-clusters scans every cluster above in parallel
 """
 
 import argparse
@@ -18,9 +20,22 @@ import json
 import os
 import subprocess
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # Default kubeconfig locations for NKP clusters
 DEFAULT_KUBECONFIGS = {
@@ -29,6 +44,16 @@ DEFAULT_KUBECONFIGS = {
     'workload2': '/Users/deepak.muley/ws/nkp/dm-nkp-workload-2.kubeconfig'
 }
 
+# Maximum time allowed for extract_cves_from_kubescape.py
+EXTRACT_TIMEOUT = 300  # 5 minutes
+
+# Write buffer for the Jira report file (1 MiB)
+JIRA_REPORT_BUFFER_SIZE = 1 << 20
+
+# Errors raised when the extract script output is not valid JSON
+# (orjson.JSONDecodeError is a subclass of json.JSONDecodeError)
+JSON_ERRORS = (json.JSONDecodeError,) + ((ijson.JSONError,) if ijson else ())
+
 CLUSTER_NAMES = {
     'mgmt': 'Management Cluster (dm-nkp-mgmt-1)',
     'workload1': 'Workload Cluster 1 (dm-nkp-workload-1)',
@@ -61,28 +86,31 @@ def to_upper(text):
 def check_kubescape_operator():
     """Check if Kubescape operator is installed."""
     try:
-        # Check for any vulnerability-related CRD
+        # Look up the API group serving VulnerabilityManifests directly, rather
+        # than listing every CRD and grepping. Kubescape serves it from an
+        # aggregated API server, so it does not show up as a CRD.
         result = subprocess.run(
-            "kubectl get crd | grep -i vulnerability",
-            shell=True,
+            ["kubectl", "get", "--raw", "/apis/spdx.softwarecomposition.kubescape.io/v1beta1"],
             capture_output=True,
             check=False
         )
-        return result.returncode == 0 and result.stdout.strip()
-    except:
+        return result.returncode == 0
+    except OSError:
         return False
 
 
 def get_cves(severity, namespace_filter, kubeconfig):
-    """Get CVEs using the extract_cves_from_kubescape.py script."""
+    """
+    Get CVEs using the extract_cves_from_kubescape.py script.
+
+    Returns a (cves, error) tuple; error is a message to show the user, or None on success.
+    Nothing is printed here, so it is safe to call from worker threads.
+    """
     script_dir = Path(__file__).parent
     extract_script = script_dir / "extract_cves_from_kubescape.py"
 
     if not extract_script.exists():
-        print(f"{Colors.RED}Error: extract_cves_from_kubescape.py not found{Colors.NC}", file=sys.stderr)
-        return []
-
-    print(f"{Colors.CYAN}Querying Kubescape Operator CRDs...{Colors.NC}")
+        return [], "Error: extract_cves_from_kubescape.py not found"
 
     cmd = [
         sys.executable,
@@ -94,83 +122,118 @@ def get_cves(severity, namespace_filter, kubeconfig):
     if namespace_filter:
         cmd.extend(["--namespace", namespace_filter])
 
+    timed_out = threading.Event()
+
     try:
         # Set environment variable for subprocess
         env = os.environ.copy()
         env['KUBECONFIG'] = kubeconfig
 
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=False,
-            env=env,
-            timeout=300  # 5 minute timeout
-        )
-
-        if result.returncode != 0:
-            if result.stderr:
-                print(f"{Colors.RED}Error running extract script: {result.stderr}{Colors.NC}", file=sys.stderr)
-            return []
-
-        if result.stdout.strip():
-            return json.loads(result.stdout)
-        return []
+        # stderr is spooled to a temp file rather than a pipe: nothing reads it
+        # until stdout is done, and a full stderr pipe would block the child.
+        with tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                env=env
+            )
+
+            def kill_on_timeout():
+                timed_out.set()
+                proc.kill()
+
+            # The extract script streams its JSON array, so parse it while it is
+            # still being written instead of waiting for the process to exit.
+            timer = threading.Timer(EXTRACT_TIMEOUT, kill_on_timeout)
+            timer.start()
+            try:
+                try:
+                    cves = read_json_array(proc.stdout)
+                    parse_error = None
+                except JSON_ERRORS as e:
+                    cves = []
+                    parse_error = e
+                proc.wait()
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode(errors='replace')
+            finally:
+                timer.cancel()
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, EXTRACT_TIMEOUT)
+
+        if proc.returncode != 0:
+            return [], f"Error running extract script: {stderr}" if stderr else None
+
+        if parse_error:
+            raise parse_error
+        return cves, None
     except subprocess.TimeoutExpired:
-        print(f"{Colors.RED}Error: Extract script timed out after 5 minutes{Colors.NC}", file=sys.stderr)
-        return []
-    except json.JSONDecodeError as e:
-        print(f"{Colors.RED}Error parsing JSON: {e}{Colors.NC}", file=sys.stderr)
-        return []
+        return [], "Error: Extract script timed out after 5 minutes"
+    except JSON_ERRORS as e:
+        return [], f"Error parsing JSON: {e}"
     except Exception as e:
-        print(f"{Colors.RED}Error: {e}{Colors.NC}", file=sys.stderr)
+        return [], f"Error: {e}"
+
+
+def read_json_array(stream):
+    """Read a JSON array from a binary stream, element by element when ijson is available."""
+    if not stream.peek(1):
         return []
+    if ijson is None:
+        if orjson is not None:
+            return orjson.loads(stream.read())
+        return json.load(stream)
+    return list(ijson.items(stream, 'item', use_float=True))
+
 
+def bucket_cves(cves):
+    """
+    Group CVEs by severity in a single pass.
 
-def count_cves_by_severity(cves, severity_filter):
-    """Count CVEs by severity."""
-    counts = {'critical': 0, 'high': 0, 'medium': 0, 'low': 0}
+    Returns a dict of critical/high/medium/low lists, plus 'other' for any CVE whose severity
+    matches none of them (e.g. negligible or unknown).
+    """
+    buckets = {'critical': [], 'high': [], 'medium': [], 'low': []}
+    other = []
 
     for cve in cves:
         sev = cve.get('severity', 'unknown').lower()
-        if severity_filter == 'all' or severity_filter in sev:
-            if 'critical' in sev:
-                counts['critical'] += 1
-            elif 'high' in sev:
-                counts['high'] += 1
-            elif 'medium' in sev:
-                counts['medium'] += 1
-            elif 'low' in sev:
-                counts['low'] += 1
+        for key, bucket in buckets.items():
+            if key in sev:
+                bucket.append(cve)
+                break
+        else:
+            other.append(cve)
 
-    return counts
+    buckets['other'] = other
+    return buckets
 
 
-def display_cves(cves, severity_filter, cluster_name):
-    """Display CVEs in a formatted way."""
+def display_cves(buckets, severity_filter, cluster_name):
+    """Display CVEs, grouped by bucket_cves(), in a formatted way."""
     header_text = f"CVE Report - {cluster_name} (Severity: {to_upper(severity_filter)})"
-    if not cves:
+    if not any(buckets.values()):
         print_header(header_text)
         print(f"{Colors.GREEN}✓ No CVEs found matching severity filter: {severity_filter}{Colors.NC}\n")
         return
 
-    counts = count_cves_by_severity(cves, severity_filter)
-
     print_header(header_text)
     print(f"{Colors.CYAN}Summary:{Colors.NC}")
-    print(f"  {Colors.RED}Critical: {counts['critical']}{Colors.NC}")
-    print(f"  {Colors.YELLOW}High: {counts['high']}{Colors.NC}")
-    print(f"  {Colors.BLUE}Medium: {counts['medium']}{Colors.NC}")
-    print(f"  {Colors.GREEN}Low: {counts['low']}{Colors.NC}")
+    print(f"  {Colors.RED}Critical: {len(buckets['critical'])}{Colors.NC}")
+    print(f"  {Colors.YELLOW}High: {len(buckets['high'])}{Colors.NC}")
+    print(f"  {Colors.BLUE}Medium: {len(buckets['medium'])}{Colors.NC}")
+    print(f"  {Colors.GREEN}Low: {len(buckets['low'])}{Colors.NC}")
     print()
 
     # Group by severity
     for sev in ['critical', 'high', 'medium', 'low']:
         if severity_filter == 'all' or severity_filter == sev:
-            sev_cves = [
-                c for c in cves
-                if sev in c.get('severity', 'unknown').lower()
-            ]
+            sev_cves = buckets[sev]
 
             if sev_cves:
                 print(f"{Colors.CYAN}{'─' * 64}{Colors.NC}")
@@ -188,8 +251,23 @@ def display_cves(cves, severity_filter, cluster_name):
                     print(f"{'─' * 64}\n")
 
 
-def generate_jira_report(cves, severity_filter, namespace_filter, cluster_name, cluster_key):
-    """Generate a Jira-friendly markdown report."""
+def format_jira_row(cve):
+    """Format a CVE as a row of the Jira markdown findings table."""
+    cve_id = cve.get('cve', 'N/A')
+    component = cve.get('component', 'N/A')
+    namespace = cve.get('namespace', 'N/A')
+    image = cve.get('image', 'N/A')
+    fixed_version = cve.get('fixedVersion', 'N/A')
+    description = cve.get('description', 'N/A')
+
+    # Escape pipe characters in description for markdown table
+    description = description.replace('|', '\\|')
+
+    return f"| {cve_id} | {component} | {namespace} | {image} | {fixed_version} | {description} |\n"
+
+
+def generate_jira_report(buckets, severity_filter, namespace_filter, cluster_name, cluster_key):
+    """Generate a Jira-friendly markdown report from CVEs grouped by bucket_cves()."""
     report_suffix = f"{cluster_key}-{severity_filter}"
     if namespace_filter:
         ns_suffix = namespace_filter.replace(',', '-')
@@ -200,61 +278,55 @@ def generate_jira_report(cves, severity_filter, namespace_filter, cluster_name,
 
     print_header("Generating Jira Report")
 
-    with open(report_file, 'w') as f:
-        f.write("# Kubescape CVE Report\n\n")
-        f.write(f"**Cluster:** {cluster_name}\n")
-        f.write(f"**Severity Filter:** {to_upper(severity_filter)}\n")
+    # A large buffer lets the whole report go out in a few writes
+    with open(report_file, 'w', buffering=JIRA_REPORT_BUFFER_SIZE) as f:
+        header = [
+            "# Kubescape CVE Report\n\n",
+            f"**Cluster:** {cluster_name}\n",
+            f"**Severity Filter:** {to_upper(severity_filter)}\n",
+        ]
         if namespace_filter:
-            f.write(f"**Namespace Filter:** {namespace_filter}\n")
-        f.write(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        f.write("---\n\n")
-
-        if not cves:
-            f.write("## Summary\n\n")
-            f.write(f"✅ No CVEs found matching severity filter: `{severity_filter}`\n\n")
+            header.append(f"**Namespace Filter:** {namespace_filter}\n")
+        header.append(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        header.append("---\n\n")
+        f.write("".join(header))
+
+        if not any(buckets.values()):
+            f.write(
+                "## Summary\n\n"
+                f"✅ No CVEs found matching severity filter: `{severity_filter}`\n\n"
+            )
         else:
-            counts = count_cves_by_severity(cves, severity_filter)
-
-            f.write("## Summary\n\n")
-            f.write("| Severity | Count |\n")
-            f.write("|----------|-------|\n")
-            f.write(f"| 🔴 Critical | {counts['critical']} |\n")
-            f.write(f"| 🟠 High | {counts['high']} |\n")
-            f.write(f"| 🟡 Medium | {counts['medium']} |\n")
-            f.write(f"| 🟢 Low | {counts['low']} |\n\n")
-            f.write("---\n\n")
-
-            f.write("## Detailed Findings\n\n")
+            f.write(
+                "## Summary\n\n"
+                "| Severity | Count |\n"
+                "|----------|-------|\n"
+                f"| 🔴 Critical | {len(buckets['critical'])} |\n"
+                f"| 🟠 High | {len(buckets['high'])} |\n"
+                f"| 🟡 Medium | {len(buckets['medium'])} |\n"
+                f"| 🟢 Low | {len(buckets['low'])} |\n\n"
+                "---\n\n"
+                "## Detailed Findings\n\n"
+            )
 
             for sev in ['critical', 'high', 'medium', 'low']:
                 if severity_filter == 'all' or severity_filter == sev:
-                    sev_cves = [
-                        c for c in cves
-                        if sev in c.get('severity', 'unknown').lower()
-                    ]
+                    sev_cves = buckets[sev]
 
                     if sev_cves:
-                        f.write(f"### {to_upper(sev)} Severity CVEs\n\n")
-                        f.write("| CVE ID | Component | Namespace | Image | Fixed Version | Description |\n")
-                        f.write("|--------|-----------|-----------|-------|--------------|-------------|\n")
-
-                        for cve in sev_cves:
-                            cve_id = cve.get('cve', 'N/A')
-                            component = cve.get('component', 'N/A')
-                            namespace = cve.get('namespace', 'N/A')
-                            image = cve.get('image', 'N/A')
-                            fixed_version = cve.get('fixedVersion', 'N/A')
-                            description = cve.get('description', 'N/A')
-
-                            # Escape pipe characters in description for markdown table
-                            description = description.replace('|', '\\|')
-
-                            f.write(f"| {cve_id} | {component} | {namespace} | {image} | {fixed_version} | {description} |\n")
-
-                        f.write("\n")
-
-        f.write("---\n\n")
-        f.write("*Report generated by kubescape CVE scanner*\n")
+                        rows = [
+                            f"### {to_upper(sev)} Severity CVEs\n\n",
+                            "| CVE ID | Component | Namespace | Image | Fixed Version | Description |\n",
+                            "|--------|-----------|-----------|-------|--------------|-------------|\n",
+                        ]
+                        rows.extend(format_jira_row(cve) for cve in sev_cves)
+                        rows.append("\n")
+                        f.write("".join(rows))
+
+        f.write(
+            "---\n\n"
+            "*Report generated by kubescape CVE scanner*\n"
+        )
 
     print(f"{Colors.GREEN}✓ Jira report saved to: {report_file}{Colors.NC}\n")
 
@@ -268,6 +340,7 @@ Examples:
   %(prog)s critical mgmt
   %(prog)s high workload1 --namespace default,kube-system
   %(prog)s all workload2 --namespace kommander
+  %(prog)s critical --all-clusters
         """
     )
 
@@ -292,44 +365,85 @@ Examples:
         help='Comma-separated list of namespaces to filter'
     )
 
+    parser.add_argument(
+        '--all-clusters',
+        action='store_true',
+        help='Scan mgmt, workload1 and workload2 in parallel (ignores the cluster argument)'
+    )
+
     args = parser.parse_args()
 
+    cluster_keys = list(DEFAULT_KUBECONFIGS) if args.all_clusters else [args.cluster]
+
     # Set kubeconfig
-    kubeconfig = DEFAULT_KUBECONFIGS.get(args.cluster)
-    if not kubeconfig or not os.path.exists(kubeconfig):
-        print(f"{Colors.RED}Error: Kubeconfig not found: {kubeconfig}{Colors.NC}", file=sys.stderr)
+    kubeconfigs = {}
+    for cluster_key in cluster_keys:
+        kubeconfig = DEFAULT_KUBECONFIGS.get(cluster_key)
+        if not kubeconfig or not os.path.exists(kubeconfig):
+            print(f"{Colors.RED}Error: Kubeconfig not found: {kubeconfig}{Colors.NC}", file=sys.stderr)
+            if not args.all_clusters:
+                sys.exit(1)
+            continue
+        kubeconfigs[cluster_key] = kubeconfig
+
+    if not kubeconfigs:
         sys.exit(1)
 
-    cluster_name = CLUSTER_NAMES.get(args.cluster, args.cluster)
-
-    # Set kubeconfig environment variable first
-    os.environ['KUBECONFIG'] = kubeconfig
+    if not args.all_clusters:
+        # Set kubeconfig environment variable first
+        os.environ['KUBECONFIG'] = kubeconfigs[args.cluster]
 
     # Print header
     print_header("Kubescape CVE Scanner")
-    print(f"{Colors.CYAN}Cluster:{Colors.NC} {cluster_name}")
+    for cluster_key in kubeconfigs:
+        print(f"{Colors.CYAN}Cluster:{Colors.NC} {CLUSTER_NAMES.get(cluster_key, cluster_key)}")
     print(f"{Colors.CYAN}Severity Filter:{Colors.NC} {to_upper(args.severity)}")
     if args.namespace:
         print(f"{Colors.CYAN}Namespace Filter:{Colors.NC} {args.namespace}")
-    print(f"{Colors.CYAN}Kubeconfig:{Colors.NC} {kubeconfig}")
+    for kubeconfig in kubeconfigs.values():
+        print(f"{Colors.CYAN}Kubeconfig:{Colors.NC} {kubeconfig}")
     print()
 
     # Check for Kubescape operator (skip check, proceed if extract script works)
     print(f"{Colors.GREEN}✓ Using Kubescape Operator CRDs{Colors.NC}\n")
 
-    # Get CVEs
-    cves = get_cves(args.severity, args.namespace, kubeconfig)
+    # Get CVEs. Each cluster is a separate extract script talking to its own
+    # apiserver (get_cves passes KUBECONFIG to it), so they run in parallel and
+    # each report is produced as soon as its cluster finishes. All output is
+    # printed from this thread, so clusters' output never interleaves.
+    with ThreadPoolExecutor(max_workers=len(kubeconfigs)) as executor:
+        futures = {}
+        for cluster_key, kubeconfig in kubeconfigs.items():
+            if args.all_clusters:
+                print(f"{Colors.CYAN}Querying Kubescape Operator CRDs ({cluster_key})...{Colors.NC}")
+            else:
+                print(f"{Colors.CYAN}Querying Kubescape Operator CRDs...{Colors.NC}")
+            futures[executor.submit(get_cves, args.severity, args.namespace, kubeconfig)] = cluster_key
+
+        for future in as_completed(futures):
+            cluster_key = futures[future]
+            cluster_name = CLUSTER_NAMES.get(cluster_key, cluster_key)
+            cves, error = future.result()
+
+            if error:
+                prefix = f"[{cluster_key}] " if args.all_clusters else ""
+                print(f"{Colors.RED}{prefix}{error}{Colors.NC}", file=sys.stderr)
+
+            # Group by severity once for both the display and the report
+            buckets = bucket_cves(cves)
+
+            # Display results
+            display_cves(buckets, args.severity, cluster_name)
 
-    # Display results
-    display_cves(cves, args.severity, cluster_name)
+            # Generate Jira report
+            generate_jira_report(buckets, args.severity, args.namespace, cluster_name, cluster_key)
 
-    # Generate Jira report
-    generate_jira_report(cves, args.severity, args.namespace, cluster_name, args.cluster)
+    report_cluster = '*' if args.all_clusters else args.cluster
 
     print_header("Report Complete")
     print(f"{Colors.GREEN}✓ CVE scan completed{Colors.NC}\n")
     print(f"To view the Jira report:")
-    print(f"  {Colors.CYAN}cat kubescape-cve-report-{args.cluster}-{args.severity}*.md{Colors.NC}\n")
+    print(f"  {Colors.CYAN}cat kubescape-cve-report-{report_cluster}-{args.severity}*.md{Colors.NC}\n")
 
 
 if __name__ == '__main__':
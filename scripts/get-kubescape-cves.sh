@@ -437,8 +437,14 @@ get_cves_via_operator() {
         cmd_args+=("--kubeconfig" "$KUBECONFIG")
     fi
 
-    # Run Python script and return JSON output
-    python3 "$python_script" "${cmd_args[@]}" 2>/dev/null || echo "[]"
+    # Run Python script and return JSON output. The script streams its array,
+    # so a failure can leave a partial array on stdout; capture it and fall
+    # back to an empty array rather than appending to it.
+    local output
+    if ! output=$(python3 "$python_script" "${cmd_args[@]}" 2>/dev/null); then
+        output="[]"
+    fi
+    echo "$output"
 
     # Legacy code below (kept for reference but not used)
     return